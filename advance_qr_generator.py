@@ -1,27 +1,44 @@
+import numpy as np
+import pymupdf
 import qrcode
 from PIL import Image, ImageDraw, ImageFont
-from reportlab.lib.pagesizes import A1, A2, A3, A4, A5
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm
+import functools
+import hashlib
+import itertools
 import os
 import math
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
 
-# Page sizes for PDF output, mapping string names to reportlab objects and dimensions in cm
+# Page sizes for PDF output, mapping string names to (width, height) in cm
 PAGE_SIZES = {
-    "A1": (A1, 59.4, 84.1),
-    "A2": (A2, 42.0, 59.4),
-    "A3": (A3, 29.7, 42.0),
-    "A4": (A4, 21.0, 29.7),
-    "A5": (A5, 14.8, 21.0),
+    "A1": (59.4, 84.1),
+    "A2": (42.0, 59.4),
+    "A3": (29.7, 42.0),
+    "A4": (21.0, 29.7),
+    "A5": (14.8, 21.0),
 }
 DPI = 300  # Dots per inch for PNG conversion, a standard for printing
+CM_TO_PT = 72 / 2.54  # PDF user space units (points) per centimeter
+MAX_ROWS_PER_PNG = 16  # Row count above which the PNG output is split into band files
+# Cheap zlib preset for PNG encoding: QR mosaics are mostly flat white, so
+# level 1 saves several times faster than the default level 6 for only a
+# small size increase.
+PNG_SAVE_OPTS = {"format": "PNG", "optimize": False, "compress_level": 1}
 
 def cm_to_pixels(cm_value):
     """Converts centimeters to pixels based on DPI."""
     return int(cm_value * DPI / 2.54)
 
 def get_qr_data():
-    """Gets the data for QR codes from the user, handling single or range types."""
+    """Gets the data for QR codes from the user, handling single or range types.
+
+    Returns (data_iter, total_qrs, longest_payload). data_iter is lazy for
+    number ranges so large batches are never materialized as one list;
+    longest_payload drives QR version selection without consuming the
+    iterator.
+    """
     while True:
         print("\nSelect the type of QR code to generate:")
         print("1: Single link or text")
@@ -29,7 +46,7 @@ def get_qr_data():
         choice = input("Enter your choice (1 or 2): ")
         if choice == '1':
             data = input("🔗 Enter the link or text to encode: ")
-            return [data]
+            return iter([data]), 1, data
         elif choice == '2':
             try:
                 start_str = input("Enter the starting number (e.g., 00001): ")
@@ -47,48 +64,176 @@ def get_qr_data():
                     print("❌ Error: The starting number cannot be greater than the ending number.")
                     continue
                     
-                # Generate numbers with zero-padding
-                return [str(i).zfill(padding) for i in range(start_num, end_num + 1)]
+                # Generate numbers with zero-padding. Hoisting the format
+                # operation into a bound method and mapping it keeps the
+                # int->str conversion in C for large ranges.
+                fmt = f"%0{padding}d".__mod__
+                total = end_num - start_num + 1
+                return map(fmt, range(start_num, end_num + 1)), total, fmt(end_num)
             except ValueError:
                 print("❌ Invalid number format. Please try again.")
         else:
             print("❌ Invalid choice. Please enter 1 or 2.")
 
-def generate_qr_image(data, qr_width_px, qr_height_px, include_text=False):
+@functools.lru_cache(maxsize=4)
+def get_qr_encoder(qr_version):
+    """Returns a reusable QRCode encoder pinned to the given version.
+
+    qrcode.make builds a fresh QRCode object and auto-detects the version
+    on every call; for a batch of same-length payloads the version never
+    changes, so one preconfigured instance per process is reused instead.
+    """
+    return qrcode.QRCode(version=qr_version, border=2)
+
+def best_fit_version(longest_payload):
+    """Picks the smallest QR version that holds the longest payload in the batch.
+
+    Must run in the main process before the worker pool starts: version
+    fitting walks qrcode's shared BIT_LIMIT_TABLE with bisect, which is
+    not safe under concurrent first use, so this call doubles as the
+    warmup that keeps the lookup out of the workers.
+    """
+    qr = qrcode.QRCode(border=2)
+    qr.add_data(longest_payload)
+    return qr.best_fit()
+
+@functools.lru_cache(maxsize=1)
+def get_label_font():
+    """Loads the label font once; reloading it per QR wastes time in a loop."""
+    return ImageFont.load_default(size=42)
+
+@functools.lru_cache(maxsize=64)
+def get_digit_label_size(num_digits):
+    """Returns (width, height) of a numeric label, memoized by digit count.
+
+    All zero-padded IDs in a range share the same length, so their labels
+    measure identically and the bbox only needs computing once per run.
+    """
+    bbox = get_label_font().getbbox('0' * num_digits)
+    return bbox[2] - bbox[0], bbox[3] - bbox[1]
+
+def generate_qr_bits(data, qr_width_px, qr_height_px, qr_version=None):
+    """Generates a QR code as a 0/255 uint8 array at the target pixel size.
+
+    A QR code is a binary grid, so when the pixel target is a whole
+    multiple of the module count the matrix is expanded nearest-neighbor
+    with np.kron, which is much faster than LANCZOS resampling and keeps
+    the modules perfectly crisp. Pass qr_version (see best_fit_version)
+    when generating a batch of similar payloads so version auto-detection
+    runs once, not per QR. Without a pinned version this is not safe to
+    call from multiple threads (qrcode's version fitting bisects a shared
+    table); the batch pipeline uses processes, which sidesteps this.
+    """
+    qr = get_qr_encoder(qr_version)
+    qr.clear()
+    qr.add_data(data)
+    qr.make(fit=qr_version is None)
+    modules = np.array(qr.get_matrix(), dtype=np.uint8)
+    num_modules = modules.shape[0]
+    scale_x = qr_width_px // num_modules
+    scale_y = qr_height_px // num_modules
+    if scale_x > 0 and qr_width_px % num_modules == 0 and qr_height_px % num_modules == 0:
+        return np.kron(1 - modules, np.ones((scale_y, scale_x), dtype=np.uint8)) * 255
+    # Non-integer scale: render at module resolution, then smooth-resize
+    small = Image.fromarray((1 - modules) * 255, mode='L')
+    return np.asarray(small.resize((qr_width_px, qr_height_px), Image.Resampling.LANCZOS))
+
+def generate_qr_image(data, qr_width_px, qr_height_px, include_text=False, qr_version=None):
     """Generates a single QR code image and optionally adds the data as text below it."""
-    qr_img = qrcode.make(data, border=2)
-    qr_img = qr_img.resize((qr_width_px, qr_height_px), Image.Resampling.LANCZOS)
+    qr_img = Image.fromarray(generate_qr_bits(data, qr_width_px, qr_height_px, qr_version), mode='L')
 
     if not include_text:
         return qr_img
 
     # Add space for text below the QR code
-    font = ImageFont.load_default(size=42)
-
-    text_bbox = font.getbbox(data)
-    text_width = text_bbox[2] - text_bbox[0]
-    text_height = text_bbox[3] - text_bbox[1]
+    font = get_label_font()
+
+    if data.isdigit():
+        text_width, text_height = get_digit_label_size(len(data))
+    else:
+        text_bbox = font.getbbox(data)
+        text_width = text_bbox[2] - text_bbox[0]
+        text_height = text_bbox[3] - text_bbox[1]
     
-    # Create a new image with extra height for the text
+    # Create a new image with extra height for the text. Staying in
+    # grayscale avoids a mode conversion on every paste and keeps the
+    # composed mosaic at a third of the RGB memory footprint.
     total_height = qr_height_px + text_height + 15  # 15px padding
-    final_img = Image.new('RGB', (qr_width_px, total_height), 'white')
+    final_img = Image.new('L', (qr_width_px, total_height), 255)
     final_img.paste(qr_img, (0, 0))
 
     # Draw the text centered below the QR code
     draw = ImageDraw.Draw(final_img)
     text_x = (qr_width_px - text_width) / 2
     text_y = qr_height_px + 5 # 5px padding
-    draw.text((text_x, text_y), data, fill='black', font=font)
+    draw.text((text_x, text_y), data, fill=0, font=font)
 
     return final_img
 
+def generate_qr_png_bytes(data, qr_width_px, qr_height_px, include_text=False, qr_version=None):
+    """Generates a QR code and returns it as PNG-encoded bytes.
+
+    Used by the PDF path so the PNG encode runs in the worker pool
+    alongside generation instead of in the placement loop.
+    """
+    qr_img = generate_qr_image(data, qr_width_px, qr_height_px, include_text, qr_version)
+    buf = BytesIO()
+    qr_img.save(buf, **PNG_SAVE_OPTS)
+    return buf.getvalue()
+
+def run_chunk(fn, chunk):
+    """Worker-side helper for bounded_pool_map: applies fn to one chunk of items."""
+    return [fn(item) for item in chunk]
+
+def bounded_pool_map(executor, fn, iterable, chunk_size=32, window=None):
+    """Maps fn over iterable through the pool with bounded in-flight work.
+
+    Executor.map submits every task immediately, so its results pile up
+    as fast as the workers finish no matter how slowly they are consumed
+    and peak memory grows with the whole input. This submits fixed-size
+    chunks and keeps at most `window` of them in flight, refilling one
+    chunk per chunk consumed, so buffered results stay capped at
+    chunk_size * window items while every core stays busy. The first
+    window is submitted before the generator is first pulled, letting
+    generation overlap the remaining interactive prompts.
+    """
+    if window is None:
+        window = 2 * (os.cpu_count() or 1)
+    items = iter(iterable)
+    chunks = iter(lambda: list(itertools.islice(items, chunk_size)), [])
+    run = functools.partial(run_chunk, fn)
+    pending = deque(executor.submit(run, chunk)
+                    for chunk in itertools.islice(chunks, window))
+
+    def results():
+        while pending:
+            done = pending.popleft().result()
+            for chunk in itertools.islice(chunks, 1):
+                pending.append(executor.submit(run, chunk))
+            yield from done
+    return results()
+
+def build_mosaic(qr_tiles, qrs_per_row, single_qr_w, single_qr_h):
+    """Tiles a list of equally sized grayscale uint8 arrays into one array.
+
+    Fills a (rows, cols, H, W) grid and folds it into the final image
+    with a single transpose/reshape; empty trailing cells stay white.
+    Everything stays in mode 'L', which moves a third of the bytes an
+    RGB canvas would.
+    """
+    rows = (len(qr_tiles) + qrs_per_row - 1) // qrs_per_row
+    arr = np.full((rows, qrs_per_row, single_qr_h, single_qr_w), 255, dtype=np.uint8)
+    for i, tile in enumerate(qr_tiles):
+        arr[i // qrs_per_row, i % qrs_per_row] = tile
+    return arr.transpose(0, 2, 1, 3).reshape(rows * single_qr_h, qrs_per_row * single_qr_w)
+
 def main():
     """Main function to run the QR code generator workflow."""
     print("--- Advanced QR Code Generator ---")
 
     # 1. Get data
-    qr_data_list = get_qr_data()
-    if not qr_data_list:
+    qr_data_iter, total_qrs, longest_payload = get_qr_data()
+    if total_qrs == 0:
         print("❌ No data provided. Exiting.")
         return
 
@@ -116,148 +261,214 @@ def main():
     include_text_str = input("Include the text below the QR code? (yes/no): ").lower()
     include_text = include_text_str in ['yes', 'y']
 
-    # Generate all QR code images in memory first
-    print("\n⏳ Generating QR code images...")
-    qr_images = [generate_qr_image(data, qr_width_px, qr_height_px, include_text) for data in qr_data_list]
-    print("✅ All QR code images generated.")
+    # Stream QR generation through the pool instead of materializing every
+    # image up front: the output branches below pull from qr_images_iter as
+    # they place images, and bounded_pool_map keeps only a fixed window of
+    # chunks in flight, so peak memory is the working set (one PNG band /
+    # one PDF page) plus that window rather than the whole batch.
+    # Generation is pure CPU work (encode + resize + text draw), fanned
+    # out across cores.
+    print("\n⏳ Generating QR code images in the background...")
+    # Version fitting must happen here, before the pool fans out — see
+    # best_fit_version on why the shared-table lookup stays single-process.
+    qr_version = best_fit_version(longest_payload)
+    # Pick the leanest worker for the job: the PDF path wants PNG bytes
+    # (keeping the encode step in the pool), the PNG path with labels
+    # needs full images for the text draw, and the plain PNG path skips
+    # Image objects entirely and ships raw uint8 arrays.
+    if output_format == "PDF":
+        worker = functools.partial(generate_qr_png_bytes, qr_width_px=qr_width_px,
+                                   qr_height_px=qr_height_px, include_text=include_text,
+                                   qr_version=qr_version)
+    elif include_text:
+        worker = functools.partial(generate_qr_image, qr_width_px=qr_width_px,
+                                   qr_height_px=qr_height_px, include_text=True,
+                                   qr_version=qr_version)
+    else:
+        worker = functools.partial(generate_qr_bits, qr_width_px=qr_width_px,
+                                   qr_height_px=qr_height_px, qr_version=qr_version)
+    executor = ProcessPoolExecutor(max_workers=os.cpu_count())
+    qr_images_iter = bounded_pool_map(executor, worker, qr_data_iter)
     
-    output_filename = input("\nEnter the output filename (without extension): ")
-
-    if output_format == "PNG":
-        # PNG specific settings
-        try:
-            total_qrs = len(qr_images)
-            qrs_per_row = int(input(f"How many QR codes per row in the final PNG? (Total QRs: {total_qrs}): "))
-            if qrs_per_row <= 0:
-                print("❌ Must be a positive number.")
-                return
+    # Everything past this point consumes the stream; if any of it bails
+    # out early, cancel the queued chunks so the interpreter is not stuck
+    # waiting for the rest of the batch to generate at exit.
+    try:
+        output_filename = input("\nEnter the output filename (without extension): ")
 
-            rows = (total_qrs + qrs_per_row - 1) // qrs_per_row
-            
-            single_qr_w, single_qr_h = qr_images[0].size
-            final_width = single_qr_w * qrs_per_row
-            final_height = single_qr_h * rows
-            
-            final_png = Image.new('RGB', (final_width, final_height), 'white')
-            
-            for i, qr_img in enumerate(qr_images):
-                row_idx = i // qrs_per_row
-                col_idx = i % qrs_per_row
-                x_pos = col_idx * single_qr_w
-                y_pos = row_idx * single_qr_h
-                final_png.paste(qr_img, (x_pos, y_pos))
-
-            output_path = f"{output_filename}.png"
-            final_png.save(output_path)
-
-        except ValueError:
-            print("❌ Invalid number for QRs per row.")
-            return
-
-    elif output_format == "PDF":
-        # --- ENHANCED PDF SETTINGS ---
-        # 1. Get page size first
-        while True:
-            page_size_name = input(f"\nChoose PDF page size ({', '.join(PAGE_SIZES.keys())}): ").upper()
-            if page_size_name in PAGE_SIZES:
-                break
-            print("❌ Invalid page size.")
-        page_size, page_width_cm, page_height_cm = PAGE_SIZES[page_size_name]
-
-        # 2. Get QR count preference
-        qr_count_choice = input("Enter number of QRs per page, or 'max' for automatic fitting: ").lower()
-
-        # 3. Get spacing between QRs
-        try:
-            row_spacing_cm = float(input("Enter space between QR rows (cm): "))
-            col_spacing_cm = float(input("Enter space between QR columns (cm): "))
-        except ValueError:
-            print("❌ Invalid spacing value. Please enter a number.")
-            return
-
-        # Define margins and drawable area
-        margin_cm = 1.0
-        drawable_width_cm = page_width_cm - (2 * margin_cm)
-        drawable_height_cm = page_height_cm - (2 * margin_cm)
-
-        # 4. Calculate layout based on user choice
-        if qr_count_choice == 'max':
-            eff_qr_width = qr_width_cm + col_spacing_cm
-            eff_qr_height = qr_height_cm + row_spacing_cm
-            if eff_qr_width <= 0 or eff_qr_height <= 0:
-                 print("❌ QR dimensions plus spacing must be positive.")
-                 return
-            qrs_per_row = int((drawable_width_cm + col_spacing_cm) // eff_qr_width)
-            qrs_per_col = int((drawable_height_cm + row_spacing_cm) // eff_qr_height)
-            if qrs_per_row == 0 or qrs_per_col == 0:
-                print(f"❌ QR code is too large to fit on an {page_size_name} page.")
-                return
-            qrs_to_place_on_page = qrs_per_row * qrs_per_col
-        else:
+        if output_format == "PNG":
+            # PNG specific settings
             try:
-                num_qrs = int(qr_count_choice)
-                if num_qrs <= 0:
-                    print("❌ Number of QRs must be positive.")
+                qrs_per_row = int(input(f"How many QR codes per row in the final PNG? (Total QRs: {total_qrs}): "))
+                if qrs_per_row <= 0:
+                    print("❌ Must be a positive number.")
                     return
-                # Find a balanced grid layout (e.g., for 10, try 3x4)
-                rows = int(math.sqrt(num_qrs))
-                cols = math.ceil(num_qrs / rows)
-                
-                total_width = (cols * qr_width_cm) + (max(0, cols - 1) * col_spacing_cm)
-                total_height = (rows * qr_height_cm) + (max(0, rows - 1) * row_spacing_cm)
 
-                if total_width > drawable_width_cm or total_height > drawable_height_cm:
-                    print(f"❌ A {rows}x{cols} grid for {num_qrs} QRs does not fit on {page_size_name}.")
-                    print(f"  -> Needs: {total_width:.2f}x{total_height:.2f} cm | Available: {drawable_width_cm:.2f}x{drawable_height_cm:.2f} cm")
-                    return
-                qrs_per_row = cols
-                qrs_per_col = rows
-                qrs_to_place_on_page = num_qrs
+                rows = (total_qrs + qrs_per_row - 1) // qrs_per_row
+
+                # Labelled QRs arrive as PIL images for the text draw; flatten
+                # them to arrays so the mosaic assembly below sees uint8 tiles
+                # either way. Then peek at the first tile to learn the size.
+                if include_text:
+                    qr_tiles_iter = (np.asarray(img) for img in qr_images_iter)
+                else:
+                    qr_tiles_iter = qr_images_iter
+                first_tile = next(qr_tiles_iter)
+                single_qr_h, single_qr_w = first_tile.shape
+                qr_tiles_iter = itertools.chain([first_tile], qr_tiles_iter)
+
+                # For small batches everything fits in one image. For large
+                # batches the monolithic canvas can reach multiple GB, so the
+                # output is split into band files of at most MAX_ROWS_PER_PNG
+                # rows each; at any moment only one band's tiles and canvas
+                # plus bounded_pool_map's in-flight window are live, not the
+                # whole batch.
+                if rows <= MAX_ROWS_PER_PNG:
+                    output_path = f"{output_filename}.png"
+                    mosaic = build_mosaic(list(qr_tiles_iter), qrs_per_row, single_qr_w, single_qr_h)
+                    Image.fromarray(mosaic).save(output_path, **PNG_SAVE_OPTS)
+                else:
+                    num_bands = (rows + MAX_ROWS_PER_PNG - 1) // MAX_ROWS_PER_PNG
+                    qrs_per_band = MAX_ROWS_PER_PNG * qrs_per_row
+                    print(f"🧩 Large batch: splitting output into {num_bands} PNG files of up to {MAX_ROWS_PER_PNG} rows each.")
+                    for band in range(num_bands):
+                        band_tiles = list(itertools.islice(qr_tiles_iter, qrs_per_band))
+                        mosaic = build_mosaic(band_tiles, qrs_per_row, single_qr_w, single_qr_h)
+                        band_path = f"{output_filename}_{band + 1:03d}.png"
+                        Image.fromarray(mosaic).save(band_path, **PNG_SAVE_OPTS)
+                    output_path = f"{output_filename}_001.png"
+
             except ValueError:
-                print("❌ Invalid input. Please enter a number or 'max'.")
+                print("❌ Invalid number for QRs per row.")
                 return
 
-        print(f"📄 Layout: {qrs_per_row} across, {qrs_per_col} down. (Placing up to {qrs_to_place_on_page} QRs per page).")
-        
-        # --- PDF DRAWING LOGIC ---
-        output_path = f"{output_filename}.pdf"
-        c = canvas.Canvas(output_path, pagesize=page_size)
-        
-        grid_w = (qrs_per_row * qr_width_cm) + (max(0, qrs_per_row - 1) * col_spacing_cm)
-        grid_h = (qrs_per_col * qr_height_cm) + (max(0, qrs_per_col - 1) * row_spacing_cm)
-        
-        # Center the entire grid on the page
-        x_start = (page_width_cm - grid_w) / 2
-        y_start = page_height_cm - (page_height_cm - grid_h) / 2
-
-        current_qr_index = 0
-        while current_qr_index < len(qr_images):
-            qrs_on_this_page = 0
-            y_pos = y_start - qr_height_cm
-            
-            for row in range(qrs_per_col):
-                if current_qr_index >= len(qr_images) or qrs_on_this_page >= qrs_to_place_on_page: break
-                x_pos = x_start
-                for col in range(qrs_per_row):
-                    if current_qr_index >= len(qr_images) or qrs_on_this_page >= qrs_to_place_on_page: break
-                    
-                    temp_img_path = f"temp_qr_{current_qr_index}.png"
-                    qr_images[current_qr_index].save(temp_img_path)
-                    
-                    c.drawImage(temp_img_path, x_pos * cm, y_pos * cm, width=qr_width_cm*cm, height=qr_height_cm*cm)
-                    
-                    os.remove(temp_img_path)
-                    
-                    x_pos += qr_width_cm + col_spacing_cm
-                    current_qr_index += 1
-                    qrs_on_this_page += 1
-                
-                y_pos -= (qr_height_cm + row_spacing_cm)
+        elif output_format == "PDF":
+            # --- ENHANCED PDF SETTINGS ---
+            # 1. Get page size first
+            while True:
+                page_size_name = input(f"\nChoose PDF page size ({', '.join(PAGE_SIZES.keys())}): ").upper()
+                if page_size_name in PAGE_SIZES:
+                    break
+                print("❌ Invalid page size.")
+            page_width_cm, page_height_cm = PAGE_SIZES[page_size_name]
+
+            # 2. Get QR count preference
+            qr_count_choice = input("Enter number of QRs per page, or 'max' for automatic fitting: ").lower()
+
+            # 3. Get spacing between QRs
+            try:
+                row_spacing_cm = float(input("Enter space between QR rows (cm): "))
+                col_spacing_cm = float(input("Enter space between QR columns (cm): "))
+            except ValueError:
+                print("❌ Invalid spacing value. Please enter a number.")
+                return
 
-            if current_qr_index < len(qr_images):
-                c.showPage()
-        
-        c.save()
+            # Define margins and drawable area
+            margin_cm = 1.0
+            drawable_width_cm = page_width_cm - (2 * margin_cm)
+            drawable_height_cm = page_height_cm - (2 * margin_cm)
+
+            # 4. Calculate layout based on user choice
+            if qr_count_choice == 'max':
+                eff_qr_width = qr_width_cm + col_spacing_cm
+                eff_qr_height = qr_height_cm + row_spacing_cm
+                if eff_qr_width <= 0 or eff_qr_height <= 0:
+                     print("❌ QR dimensions plus spacing must be positive.")
+                     return
+                qrs_per_row = int((drawable_width_cm + col_spacing_cm) // eff_qr_width)
+                qrs_per_col = int((drawable_height_cm + row_spacing_cm) // eff_qr_height)
+                if qrs_per_row == 0 or qrs_per_col == 0:
+                    print(f"❌ QR code is too large to fit on an {page_size_name} page.")
+                    return
+                qrs_to_place_on_page = qrs_per_row * qrs_per_col
+            else:
+                try:
+                    num_qrs = int(qr_count_choice)
+                    if num_qrs <= 0:
+                        print("❌ Number of QRs must be positive.")
+                        return
+                    # Find a grid layout that actually fits the drawable area.
+                    # Exact divisors of num_qrs are tried first, starting from
+                    # the most balanced pair (closest to a square), so a grid
+                    # like 2x5 is found for 10 QRs even when 3x4 would not fit.
+                    rows = cols = None
+                    divisors = [d for d in range(1, int(num_qrs ** 0.5) + 1) if num_qrs % d == 0]
+                    for d in reversed(divisors):
+                        for cand_rows, cand_cols in ((d, num_qrs // d), (num_qrs // d, d)):
+                            cand_width = (cand_cols * qr_width_cm) + (max(0, cand_cols - 1) * col_spacing_cm)
+                            cand_height = (cand_rows * qr_height_cm) + (max(0, cand_rows - 1) * row_spacing_cm)
+                            if cand_width <= drawable_width_cm and cand_height <= drawable_height_cm:
+                                rows, cols = cand_rows, cand_cols
+                                break
+                        if rows is not None:
+                            break
+
+                    if rows is None:
+                        # No exact divisor grid fits; fall back to the near-square
+                        # grid and report if even that is too large.
+                        rows = int(math.sqrt(num_qrs))
+                        cols = math.ceil(num_qrs / rows)
+                        total_width = (cols * qr_width_cm) + (max(0, cols - 1) * col_spacing_cm)
+                        total_height = (rows * qr_height_cm) + (max(0, rows - 1) * row_spacing_cm)
+                        if total_width > drawable_width_cm or total_height > drawable_height_cm:
+                            print(f"❌ A {rows}x{cols} grid for {num_qrs} QRs does not fit on {page_size_name}.")
+                            print(f"  -> Needs: {total_width:.2f}x{total_height:.2f} cm | Available: {drawable_width_cm:.2f}x{drawable_height_cm:.2f} cm")
+                            return
+                    qrs_per_row = cols
+                    qrs_per_col = rows
+                    qrs_to_place_on_page = num_qrs
+                except ValueError:
+                    print("❌ Invalid input. Please enter a number or 'max'.")
+                    return
+
+            print(f"📄 Layout: {qrs_per_row} across, {qrs_per_col} down. (Placing up to {qrs_to_place_on_page} QRs per page).")
+            
+            # --- PDF DRAWING LOGIC ---
+            output_path = f"{output_filename}.pdf"
+
+            grid_w = (qrs_per_row * qr_width_cm) + (max(0, qrs_per_row - 1) * col_spacing_cm)
+            grid_h = (qrs_per_col * qr_height_cm) + (max(0, qrs_per_col - 1) * row_spacing_cm)
+
+            # Center the entire grid on the page (PyMuPDF's origin is top-left)
+            x_start = (page_width_cm - grid_w) / 2
+            y_start = (page_height_cm - grid_h) / 2
+
+            page_width_pt = page_width_cm * CM_TO_PT
+            page_height_pt = page_height_cm * CM_TO_PT
+
+            # Precompute the slot rectangles once: every page uses the same
+            # grid, so the coordinate arithmetic and the per-QR break checks
+            # drop out of the placement loop entirely.
+            xs = [x_start + col * (qr_width_cm + col_spacing_cm) for col in range(qrs_per_row)]
+            ys = [y_start + row * (qr_height_cm + row_spacing_cm) for row in range(qrs_per_col)]
+            slot_rects = [pymupdf.Rect(x * CM_TO_PT, y * CM_TO_PT,
+                                       (x + qr_width_cm) * CM_TO_PT,
+                                       (y + qr_height_cm) * CM_TO_PT)
+                          for y in ys for x in xs][:qrs_to_place_on_page]
+
+            # The generation stream already yields PNG bytes here. Each page is
+            # emitted in one tight loop over the precomputed slots, and a
+            # repeated QR is inserted by the xref of its first embedding, which
+            # lets MuPDF skip decoding the stream again (it would deduplicate
+            # by content digest anyway, but only after re-parsing the PNG).
+            embedded_xrefs = {}  # md5 of the PNG bytes -> xref of the embedded image
+            doc = pymupdf.open()
+            current_qr_index = 0
+            while current_qr_index < total_qrs:
+                page = doc.new_page(width=page_width_pt, height=page_height_pt)
+                qrs_on_this_page = min(qrs_to_place_on_page, total_qrs - current_qr_index)
+                for rect in slot_rects[:qrs_on_this_page]:
+                    stream = next(qr_images_iter)
+                    digest = hashlib.md5(stream).digest()
+                    xref = embedded_xrefs.get(digest, 0)
+                    embedded_xrefs[digest] = page.insert_image(
+                        rect, stream=None if xref else stream, xref=xref, keep_proportion=False)
+                current_qr_index += qrs_on_this_page
+
+            doc.save(output_path, deflate=True, garbage=4)
+            doc.close()
+    finally:
+        executor.shutdown(cancel_futures=True)
 
     full_path = os.path.abspath(output_path)
     print("\n" + "="*40)